@@ -1,10 +1,14 @@
 """FastAPI routes for CryptoSanta API."""
 
+import functools
 import hashlib
+import hmac
 import uuid
 from typing import Optional
 
+import orjson
 from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import Response
 
 from backend.models.room import (
     CreateRoomRequest,
@@ -24,12 +28,46 @@ from backend.storage.room_store import ConcurrentModificationError, RoomStore
 router = APIRouter()
 
 
+def _json_response(payload: dict, etag: str) -> Response:
+    """Serialize a read response with orjson, bypassing response_model validation."""
+    return Response(
+        content=orjson.dumps(payload),
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": "no-cache"},
+    )
+
+
+def _room_etag(room: Room) -> str:
+    """Weak ETag covering every readable field of a room.
+
+    The version bumps on registration and sorting; messages are append-only
+    and stored separately, so their count covers the rest.
+    """
+    return f'W/"{room.version}-{len(room.participants)}-{len(room.messages)}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against the current ETag."""
+    if not if_none_match:
+        return False
+    return any(tag.strip() in (etag, "*") for tag in if_none_match.split(","))
+
+
+@functools.lru_cache(maxsize=1024)
+def _sha256_digest(secret: str) -> bytes:
+    """SHA-256 digest of a presented chair secret, cached per worker."""
+    return hashlib.sha256(secret.encode()).digest()
+
+
 def verify_chair(room: Room, chair_secret: Optional[str]) -> bool:
-    """Verify the chair secret matches the stored hash."""
+    """Verify the chair secret matches the stored hash (constant-time)."""
     if not chair_secret:
         return False
-    hashed = hashlib.sha256(chair_secret.encode()).hexdigest()
-    return hashed == room.chair_secret_hash
+    try:
+        expected = bytes.fromhex(room.chair_secret_hash)
+    except ValueError:
+        return False
+    return hmac.compare_digest(_sha256_digest(chair_secret), expected)
 
 
 @router.post("/room", response_model=CreateRoomResponse)
@@ -46,30 +84,37 @@ async def create_room(request: CreateRoomRequest) -> CreateRoomResponse:
         session_public_key=request.sessionPublicKey,
         chair_secret_hash=request.chairSecretHash,
     )
-    room_id = RoomStore.create_room(room)
+    room_id = await RoomStore.create_room(room)
     return CreateRoomResponse(roomId=room_id)
 
 
 @router.get("/room/{room_id}", response_model=RoomResponse)
-async def get_room(room_id: str) -> RoomResponse:
+async def get_room(
+    room_id: str,
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+) -> Response:
     """Get the current state of a room.
 
     Returns room status, parameters, and public data.
     Does not expose the raw encrypted participant keys (use /participants for that).
     """
-    room = RoomStore.get_room(room_id)
+    room = await RoomStore.get_room(room_id)
     if room is None:
         raise HTTPException(status_code=404, detail="Room not found")
 
-    return RoomResponse(
-        id=room.id,
-        status=room.status.value,
-        params={"P": room.params.P, "g": room.params.g},
-        sessionPublicKey=room.session_public_key,
-        participantCount=len(room.participants),
-        sortedKeys=room.sorted_keys,
-        messages=room.messages,
-    )
+    etag = _room_etag(room)
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    return _json_response({
+        "id": room.id,
+        "status": room.status.value,
+        "params": {"P": room.params.P, "g": room.params.g},
+        "sessionPublicKey": room.session_public_key,
+        "participantCount": len(room.participants),
+        "sortedKeys": room.sorted_keys,
+        "messages": room.messages,
+    }, etag)
 
 
 @router.post("/room/{room_id}/register")
@@ -80,7 +125,7 @@ async def register(room_id: str, request: RegisterRequest) -> dict:
     with the room's session public key.
     """
     try:
-        RoomStore.add_participant(room_id, request.encryptedKey)
+        await RoomStore.add_participant(room_id, request.encryptedKey)
         return {"success": True}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -89,16 +134,23 @@ async def register(room_id: str, request: RegisterRequest) -> dict:
 
 
 @router.get("/room/{room_id}/participants", response_model=ParticipantsResponse)
-async def get_participants(room_id: str) -> ParticipantsResponse:
+async def get_participants(
+    room_id: str,
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+) -> Response:
     """Get all encrypted participant keys.
 
     Used by the Chair to decrypt and sort the keys.
     """
-    room = RoomStore.get_room(room_id)
+    room = await RoomStore.get_room(room_id)
     if room is None:
         raise HTTPException(status_code=404, detail="Room not found")
 
-    return ParticipantsResponse(participants=room.participants)
+    etag = _room_etag(room)
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    return _json_response({"participants": room.participants}, etag)
 
 
 @router.post("/room/{room_id}/sort")
@@ -114,7 +166,7 @@ async def sort_keys(
 
     Requires X-Chair-Secret header for authentication.
     """
-    room = RoomStore.get_room(room_id)
+    room = await RoomStore.get_room(room_id)
     if room is None:
         raise HTTPException(status_code=404, detail="Room not found")
 
@@ -122,7 +174,7 @@ async def sort_keys(
         raise HTTPException(status_code=403, detail="Invalid chair secret")
 
     try:
-        RoomStore.set_sorted_keys(room_id, request.sortedKeys)
+        await RoomStore.set_sorted_keys(room_id, request.sortedKeys)
         return {"success": True}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -138,7 +190,7 @@ async def post_message(room_id: str, request: MessageRequest) -> dict:
     and broadcast it to the bulletin board.
     """
     try:
-        RoomStore.add_message(room_id, request.blob)
+        await RoomStore.add_message(room_id, request.blob)
         return {"success": True}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -147,14 +199,21 @@ async def post_message(room_id: str, request: MessageRequest) -> dict:
 
 
 @router.get("/room/{room_id}/messages", response_model=MessagesResponse)
-async def get_messages(room_id: str) -> MessagesResponse:
+async def get_messages(
+    room_id: str,
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+) -> Response:
     """Get all encrypted messages.
 
     Each participant downloads all messages and attempts to decrypt
     them with their private key. Only one will succeed.
     """
-    room = RoomStore.get_room(room_id)
+    room = await RoomStore.get_room(room_id)
     if room is None:
         raise HTTPException(status_code=404, detail="Room not found")
 
-    return MessagesResponse(messages=room.messages)
+    etag = _room_etag(room)
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    return _json_response({"messages": room.messages}, etag)
@@ -3,6 +3,8 @@
 Deploy with: uv run modal deploy backend/main.py
 """
 
+import os
+
 import modal
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -16,7 +18,16 @@ image = (
     .pip_install(
         "fastapi[standard]>=0.115.0",
         "pydantic>=2.0",
+        "orjson>=3.10",
+        "zstandard>=0.23",
+        # Event loop for the container; also pulled in by uvicorn[standard]
+        # via fastapi[standard], pinned here so it does not depend on extras
+        "uvloop>=0.19",
     )
+    # Allowed CORS origins, baked in from the deployer's shell at deploy time:
+    #   CORS_ALLOW_ORIGINS=https://santa.example.com uv run modal deploy backend/main.py
+    # Comma-separated; defaults to all origins for development.
+    .env({"CORS_ALLOW_ORIGINS": os.environ.get("CORS_ALLOW_ORIGINS", "*")})
     .add_local_python_source("backend")
 )
 
@@ -31,6 +42,8 @@ image = (
 @modal.asgi_app()
 def fastapi_app():
     """Create and configure FastAPI application."""
+    from starlette.responses import JSONResponse
+
     from backend.api.routes import router
 
     web_app = FastAPI(
@@ -39,10 +52,11 @@ def fastapi_app():
         version="0.1.0",
     )
 
-    # CORS configuration for frontend on separate domain
+    # CORS configuration for frontend on separate domain (see image env above)
+    allow_origins = os.environ.get("CORS_ALLOW_ORIGINS", "*").split(",")
     web_app.add_middleware(
         CORSMiddleware,
-        allow_origins=["*"],  # Allow all origins for development; restrict in production
+        allow_origins=[origin.strip() for origin in allow_origins],
         allow_credentials=True,
         allow_methods=["GET", "POST", "OPTIONS"],
         allow_headers=["*"],
@@ -51,9 +65,23 @@ def fastapi_app():
     # Include API routes
     web_app.include_router(router)
 
-    # Health check endpoint
+    # Health check endpoint. GET/HEAD are answered by the wrapper below,
+    # before the middleware stack, so platform pings skip CORS and routing;
+    # the route stays registered for the schema and so other methods get 405.
     @web_app.get("/health")
     async def health_check():
         return {"status": "healthy"}
 
-    return web_app
+    health_response = JSONResponse({"status": "healthy"})
+
+    async def asgi_app(scope, receive, send):
+        if (
+            scope["type"] == "http"
+            and scope["path"] == "/health"
+            and scope["method"] in ("GET", "HEAD")
+        ):
+            await health_response(scope, receive, send)
+            return
+        await web_app(scope, receive, send)
+
+    return asgi_app
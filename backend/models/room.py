@@ -1,10 +1,11 @@
 """Room models for CryptoSanta."""
 
-from datetime import datetime
+import time
+from datetime import datetime, timezone
 from enum import Enum
-from typing import Optional
+from typing import Any, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 
 
 class RoomStatus(str, Enum):
@@ -22,6 +23,9 @@ class RoomParams(BaseModel):
 
 class Room(BaseModel):
     """Room state stored in Modal Dict."""
+    # Stored payloads may carry fields from other revisions of this model
+    model_config = ConfigDict(extra="ignore")
+
     id: str
     status: RoomStatus = RoomStatus.OPEN
     params: RoomParams
@@ -29,9 +33,29 @@ class Room(BaseModel):
     chair_secret_hash: str   # SHA-256 hash of chair secret for authentication
     participants: list[str] = Field(default_factory=list)  # Encrypted public keys
     sorted_keys: list[str] = Field(default_factory=list)   # Decrypted, sorted keys
-    messages: list[str] = Field(default_factory=list)      # Encrypted message blobs
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    messages: list[str] = Field(default_factory=list)      # Encrypted message blobs (stored separately)
+    created_at_ns: int = Field(default_factory=time.time_ns)  # Unix epoch nanoseconds
     version: int = 0  # Optimistic locking version for concurrent updates
+    # Membership index over participants for O(1) duplicate checks; not stored
+    participant_set: frozenset[str] = Field(default_factory=frozenset, exclude=True)
+
+    @model_validator(mode="before")
+    @classmethod
+    def _migrate_created_at(cls, data: Any) -> Any:
+        """Convert the legacy naive-UTC created_at datetime to created_at_ns."""
+        if isinstance(data, dict) and "created_at" in data and "created_at_ns" not in data:
+            created_at = data["created_at"]
+            if isinstance(created_at, str):
+                created_at = datetime.fromisoformat(created_at)
+            created_at_ns = int(created_at.replace(tzinfo=timezone.utc).timestamp() * 1_000_000_000)
+            data = {**data, "created_at_ns": created_at_ns}
+        return data
+
+    @model_validator(mode="after")
+    def _derive_fields(self) -> "Room":
+        """Rebuild the non-stored fields once per parse."""
+        self.participant_set = frozenset(self.participants)
+        return self
 
 
 # Request/Response schemas
@@ -1,171 +1,506 @@
 """Room storage using Modal Dict with 30-day TTL and optimistic locking."""
 
+import asyncio
+import hashlib
+import random
 import time
-from datetime import datetime, timedelta
-from typing import Optional
+from collections import OrderedDict, defaultdict
+from typing import Any, Awaitable, Callable, Optional
 
 import modal
+import orjson
+import zstandard
+from pydantic import TypeAdapter
 
 from backend.models.room import Room, RoomStatus
 
 # Modal Dict for room persistence
 # TTL of 30 days = 2592000 seconds
 ROOM_TTL_SECONDS = 30 * 24 * 60 * 60
+ROOM_TTL_NS = ROOM_TTL_SECONDS * 1_000_000_000
 
 # Retry settings for optimistic locking
 MAX_RETRIES = 5
 RETRY_DELAY_MS = 50
 
+# A version claim older than this belongs to a writer that died between
+# claiming and writing (the web function times out after 60 s), so another
+# writer may take it over
+CLAIM_STALE_SECONDS = 120
+
+# Concurrent appends to the same room within this window share one write
+COALESCE_WINDOW_MS = 20
+
+# Per-worker cache of parsed rooms, keyed by a digest of the stored payload
+ROOM_CACHE_SIZE = 2048
+_room_cache: OrderedDict[bytes, Room] = OrderedDict()
+
+# Stored payloads are zstd frames; anything else predates compression
+ZSTD_LEVEL = 3
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_zstd_compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+_zstd_decompressor = zstandard.ZstdDecompressor()
+
+# Validator built once per worker and reused for every parse
+_ROOM_ADAPTER = TypeAdapter(Room)
+
 rooms_dict = modal.Dict.from_name("cryptosanta-rooms", create_if_missing=True)
 
+# One key per (room_id, version), written with skip_if_exists so exactly one
+# writer can advance a room to a given version. Message lists are versioned
+# by their length: "{room_id}:messages:{n}" claims the append that advances
+# the list from n messages, whatever the batch size. Each claim holds
+# {"at": claimed_at, "gen": n}; taking over a stale claim first wins the
+# marker key "{claim_key}~{n + 1}". All of a room's claims and markers are
+# removed with the room.
+version_claims = modal.Dict.from_name("cryptosanta-room-versions", create_if_missing=True)
+
+
+def _messages_key(room_id: str) -> str:
+    """Key of a room's append-only message list in rooms_dict."""
+    return f"{room_id}:messages"
+
+
+def _compress(payload: bytes) -> bytes:
+    """Compress a JSON payload for storage."""
+    return _zstd_compressor.compress(payload)
+
+
+def _decompress(data: bytes | str) -> bytes | str:
+    """Undo _compress. Payloads stored before compression are returned as-is."""
+    if isinstance(data, bytes) and data.startswith(_ZSTD_MAGIC):
+        return _zstd_decompressor.decompress(data)
+    return data
+
+
+def _dump_room(room: Room) -> bytes:
+    """Serialize a room for storage."""
+    return _compress(orjson.dumps(room.model_dump(mode="json")))
+
+
+def _parse_room(data: bytes | str) -> Room:
+    """Parse a stored room, memoized on a digest of the raw payload.
+
+    Every write changes the stored payload, so a stale entry can never be hit.
+    Keying on the digest rather than the payload keeps only the parsed room
+    in memory. Rooms written before the orjson switch are stored as str;
+    orjson reads both.
+    """
+    raw = data.encode() if isinstance(data, str) else data
+    key = hashlib.blake2b(raw, digest_size=16).digest()
+    room = _room_cache.get(key)
+    if room is not None:
+        _room_cache.move_to_end(key)
+        return room
+
+    room = _ROOM_ADAPTER.validate_python(orjson.loads(_decompress(data)))
+    _room_cache[key] = room
+    if len(_room_cache) > ROOM_CACHE_SIZE:
+        _room_cache.popitem(last=False)
+    return room
+
+
+async def _backoff(attempt: int) -> None:
+    """Sleep with jittered exponential backoff without blocking the event loop."""
+    delay_ms = RETRY_DELAY_MS * (2 ** attempt) * (0.5 + random.random())
+    await asyncio.sleep(delay_ms / 1000)
+
+
+def _validate_sorted_keys(sorted_keys: list[str], participants: list[str]) -> None:
+    """Check an uploaded sorted key list against the registered participants.
+
+    Raises:
+        ValueError: If < 3 keys, count mismatch, or malformed/duplicate keys.
+    """
+    if len(sorted_keys) < 3:
+        raise ValueError("Minimum 3 participants required")
+
+    # Validate sorted keys count matches participants
+    if len(sorted_keys) != len(participants):
+        raise ValueError(
+            f"Sorted keys count ({len(sorted_keys)}) must match "
+            f"participants count ({len(participants)})"
+        )
+
+    # Single pass: reject malformed keys and stop at the first duplicate
+    seen: set[str] = set()
+    for key in sorted_keys:
+        if not key.isdecimal():
+            raise ValueError("Sorted keys must be decimal strings")
+        if key in seen:
+            raise ValueError("Duplicate keys in sorted list")
+        seen.add(key)
+
 
 class ConcurrentModificationError(Exception):
     """Raised when optimistic locking fails after max retries."""
     pass
 
 
+async def _pop_quietly(d: modal.Dict, key: str) -> Any:
+    """Pop key from d, returning None if it is missing."""
+    try:
+        return await d.pop.aio(key)
+    except KeyError:
+        return None
+
+
+class _AppendCoalescer:
+    """Buffers appends per room so each batch costs a single versioned write.
+
+    apply_batch receives every item buffered for a room during the window and
+    returns one entry per item: None if it was appended, or the ValueError to
+    raise for that item alone. An exception raised by apply_batch fails the
+    whole batch.
+    """
+
+    def __init__(
+        self,
+        apply_batch: Callable[[str, list[str]], Awaitable[list[Optional[ValueError]]]],
+    ) -> None:
+        self._apply_batch = apply_batch
+        self._pending: defaultdict[str, list[tuple[str, asyncio.Future]]] = defaultdict(list)
+        self._drains: set[asyncio.Task] = set()
+
+    async def submit(self, room_id: str, item: str) -> None:
+        """Queue item for room_id and wait until its batch is written."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._pending[room_id]
+        batch.append((item, future))
+        if len(batch) == 1:
+            # First item in the window schedules the drain; keep a reference
+            # so the task is not garbage collected mid-flight
+            task = loop.create_task(self._drain(room_id, batch))
+            self._drains.add(task)
+            task.add_done_callback(lambda task: self._finish(room_id, batch, task))
+        await future
+
+    def _close_window(self, room_id: str, batch: list[tuple[str, asyncio.Future]]) -> None:
+        """Stop adding to batch; the next submit for room_id starts a new one."""
+        if self._pending.get(room_id) is batch:
+            del self._pending[room_id]
+
+    async def _drain(self, room_id: str, batch: list[tuple[str, asyncio.Future]]) -> None:
+        await asyncio.sleep(COALESCE_WINDOW_MS / 1000)
+        self._close_window(room_id, batch)
+        try:
+            errors = await self._apply_batch(room_id, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), error in zip(batch, errors):
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+    def _finish(
+        self, room_id: str, batch: list[tuple[str, asyncio.Future]], task: asyncio.Task
+    ) -> None:
+        """Runs however the drain ended, including cancellation before it started.
+
+        Closes the window and fails any caller the drain did not resolve with
+        a retryable error, so neither this room nor its callers are left
+        waiting and no caller sees a cancellation it did not ask for.
+        """
+        self._drains.discard(task)
+        self._close_window(room_id, batch)
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(
+                    ConcurrentModificationError("Write was interrupted, please try again")
+                )
+
+
 class RoomStore:
     """CRUD operations for rooms stored in Modal Dict with optimistic locking."""
 
     @staticmethod
-    def create_room(room: Room) -> str:
+    async def create_room(room: Room) -> str:
         """Store a new room and return its ID."""
-        rooms_dict[room.id] = room.model_dump_json()
+        await rooms_dict.put.aio(room.id, _dump_room(room))
         return room.id
 
     @staticmethod
-    def get_room(room_id: str) -> Optional[Room]:
-        """Retrieve a room by ID. Returns None if not found or expired."""
-        data = rooms_dict.get(room_id)
+    async def get_room(room_id: str) -> Optional[Room]:
+        """Retrieve a room by ID. Returns None if not found or expired.
+
+        Messages are stored under their own key and merged into the result.
+        """
+        # Fetch both keys concurrently; the messages key is absent until
+        # the first message is posted.
+        data, messages = await asyncio.gather(
+            rooms_dict.get.aio(room_id),
+            rooms_dict.get.aio(_messages_key(room_id)),
+        )
         if data is None:
             return None
 
-        room = Room.model_validate_json(data)
+        # Shallow copy so callers can reassign fields without touching the
+        # cached instance. List fields must be replaced, never mutated in place.
+        room = _parse_room(data).model_copy()
 
         # Check if room has expired (30 days)
-        if datetime.utcnow() - room.created_at > timedelta(seconds=ROOM_TTL_SECONDS):
+        if time.time_ns() - room.created_at_ns > ROOM_TTL_NS:
             # Clean up expired room
-            try:
-                rooms_dict.pop(room_id)
-            except KeyError:
-                pass
+            await RoomStore.delete_room(room_id)
             return None
 
+        # Rooms without a messages key keep the list embedded in the blob
+        if messages is not None:
+            room.messages = orjson.loads(_decompress(messages))
+        if room.messages and room.status == RoomStatus.SORTED:
+            room.status = RoomStatus.MESSAGING
+
         return room
 
     @staticmethod
-    def _update_room_with_version(room: Room, expected_version: int) -> bool:
-        """Update room only if version matches. Returns True if successful."""
-        # Re-read to verify version hasn't changed
-        current = RoomStore.get_room(room.id)
-        if current is None or current.version != expected_version:
+    async def _claim(
+        room_id: str, claim_key: str, still_current: Callable[[Room], bool]
+    ) -> Optional[int]:
+        """Claim claim_key, taking it over if its holder died before writing.
+
+        Returns the claim generation, or None if another writer holds it.
+        """
+        now = time.time()
+        if await version_claims.put.aio(claim_key, {"at": now, "gen": 0}, skip_if_exists=True):
+            return 0
+
+        held = await version_claims.get.aio(claim_key)
+        if held is None or now - held["at"] < CLAIM_STALE_SECONDS:
+            return None
+
+        # Successful writes keep their claims forever, so an old claim is only
+        # abandoned if the stored data has not moved past it
+        room = await RoomStore.get_room(room_id)
+        if room is None or not still_current(room):
+            return None
+
+        # Exactly one writer wins the marker for the next generation
+        gen = held["gen"] + 1
+        if not await version_claims.put.aio(f"{claim_key}~{gen}", now, skip_if_exists=True):
+            return None
+        await version_claims.put.aio(claim_key, {"at": now, "gen": gen})
+        return gen
+
+    @staticmethod
+    async def _put_claimed(
+        room_id: str,
+        claim_key: str,
+        still_current: Callable[[Room], bool],
+        key: str,
+        value: bytes,
+    ) -> bool:
+        """Write value under key if claim_key can be claimed first.
+
+        still_current tells whether the stored room is still at the state the
+        claim would advance; it is only consulted for stale claims.
+        Returns False if another writer already holds the claim.
+        """
+        gen = await RoomStore._claim(room_id, claim_key, still_current)
+        if gen is None:
             return False
 
-        room.version = expected_version + 1
-        rooms_dict[room.id] = room.model_dump_json()
+        written = False
+        try:
+            await rooms_dict.put.aio(key, value)
+            written = True
+        finally:
+            if not written:
+                # Release the claim (also on cancellation) by marking it stale,
+                # so the next writer takes it over instead of being wedged
+                await version_claims.put.aio(claim_key, {"at": 0, "gen": gen})
         return True
 
     @staticmethod
-    def delete_room(room_id: str) -> bool:
-        """Delete a room. Returns True if deleted, False if not found."""
-        try:
-            rooms_dict.pop(room_id)
-            return True
-        except KeyError:
+    async def _update_room_with_version(room: Room, expected_version: int) -> bool:
+        """Update room only if version matches. Returns True if successful."""
+        # Atomically claim the next version instead of re-reading the room.
+        # Losing the claim means another writer already advanced past
+        # expected_version.
+        next_version = expected_version + 1
+        room.version = next_version
+        return await RoomStore._put_claimed(
+            room.id,
+            f"{room.id}:{next_version}",
+            lambda current: current.version == expected_version,
+            room.id,
+            _dump_room(room),
+        )
+
+    @staticmethod
+    async def _update_messages(room_id: str, base_length: int, messages: list[str]) -> bool:
+        """Replace a room's message list if no other append got there first.
+
+        The list is append-only, so its length doubles as its version: the
+        claim is keyed on base_length, the length the new list was built from.
+        """
+        return await RoomStore._put_claimed(
+            room_id,
+            f"{_messages_key(room_id)}:{base_length}",
+            lambda current: len(current.messages) == base_length,
+            _messages_key(room_id),
+            _compress(orjson.dumps(messages)),
+        )
+
+    @staticmethod
+    async def delete_room(room_id: str) -> bool:
+        """Delete a room and its version claims.
+
+        Returns True if deleted, False if not found.
+        """
+        data, messages = await asyncio.gather(
+            rooms_dict.get.aio(room_id),
+            rooms_dict.get.aio(_messages_key(room_id)),
+        )
+        await _pop_quietly(rooms_dict, _messages_key(room_id))
+        if data is None:
             return False
 
+        room = _parse_room(data)
+        message_count = (
+            len(orjson.loads(_decompress(messages))) if messages is not None else len(room.messages)
+        )
+        deleted = await _pop_quietly(rooms_dict, room_id) is not None
+
+        # Claims exist for every committed version plus at most one beyond
+        # it, and for every length the message list has had, including now
+        claim_keys = [f"{room_id}:{v}" for v in range(1, room.version + 2)] + [
+            f"{_messages_key(room_id)}:{n}" for n in range(message_count + 1)
+        ]
+        held = await asyncio.gather(*(_pop_quietly(version_claims, k) for k in claim_keys))
+        markers = [
+            f"{claim_key}~{gen}"
+            for claim_key, claim in zip(claim_keys, held)
+            if claim is not None
+            for gen in range(1, claim["gen"] + 1)
+        ]
+        await asyncio.gather(*(_pop_quietly(version_claims, m) for m in markers))
+        return deleted
+
     @staticmethod
-    def add_participant(room_id: str, encrypted_key: str) -> None:
+    async def add_participant(room_id: str, encrypted_key: str) -> None:
         """Add an encrypted public key to participants with optimistic locking.
 
+        Concurrent registrations for the same room are coalesced into one write.
+
         Raises:
             ValueError: If room not found, registration closed, or duplicate key.
             ConcurrentModificationError: If concurrent modification detected after retries.
         """
+        await _participant_batches.submit(room_id, encrypted_key)
+
+    @staticmethod
+    async def _add_participant_batch(
+        room_id: str, encrypted_keys: list[str]
+    ) -> list[Optional[ValueError]]:
+        """Append a batch of keys with one versioned write; see _AppendCoalescer."""
         for attempt in range(MAX_RETRIES):
-            room = RoomStore.get_room(room_id)
+            room = await RoomStore.get_room(room_id)
             if room is None:
                 raise ValueError(f"Room {room_id} not found")
             if room.status != RoomStatus.OPEN:
                 raise ValueError("Registration is closed")
-            if encrypted_key in room.participants:
-                raise ValueError("Duplicate registration")
+
+            errors: list[Optional[ValueError]] = []
+            accepted: list[str] = []
+            accepted_set: set[str] = set()
+            for key in encrypted_keys:
+                if key in room.participant_set or key in accepted_set:
+                    errors.append(ValueError("Duplicate registration"))
+                else:
+                    errors.append(None)
+                    accepted.append(key)
+                    accepted_set.add(key)
+            if not accepted:
+                return errors
 
             expected_version = room.version
-            room.participants.append(encrypted_key)
+            room.participants = [*room.participants, *accepted]
+            room.participant_set = room.participant_set | accepted_set
 
-            if RoomStore._update_room_with_version(room, expected_version):
-                return
+            if await RoomStore._update_room_with_version(room, expected_version):
+                return errors
 
-            # Retry with exponential backoff
-            time.sleep(RETRY_DELAY_MS * (2 ** attempt) / 1000)
+            # Retry with jittered exponential backoff
+            await _backoff(attempt)
 
         raise ConcurrentModificationError("Failed to register after max retries, please try again")
 
     @staticmethod
-    def set_sorted_keys(room_id: str, sorted_keys: list[str]) -> None:
+    async def set_sorted_keys(room_id: str, sorted_keys: list[str]) -> None:
         """Set sorted keys and transition to SORTED state with validation.
 
         Raises:
-            ValueError: If room not found, wrong state, < 3 participants, or key count mismatch.
+            ValueError: If room not found, wrong state, < 3 participants, key count
+                mismatch, or malformed/duplicate keys.
         """
-        room = RoomStore.get_room(room_id)
+        room = await RoomStore.get_room(room_id)
         if room is None:
             raise ValueError(f"Room {room_id} not found")
         if room.status != RoomStatus.OPEN:
             raise ValueError("Room is not in OPEN state")
-        if len(sorted_keys) < 3:
-            raise ValueError("Minimum 3 participants required")
-
-        # Validate sorted keys count matches participants
-        if len(sorted_keys) != len(room.participants):
-            raise ValueError(
-                f"Sorted keys count ({len(sorted_keys)}) must match "
-                f"participants count ({len(room.participants)})"
-            )
-
-        # Check for duplicate keys in sorted list
-        if len(sorted_keys) != len(set(sorted_keys)):
-            raise ValueError("Duplicate keys in sorted list")
+        _validate_sorted_keys(sorted_keys, room.participants)
 
         expected_version = room.version
         room.sorted_keys = sorted_keys
         room.status = RoomStatus.SORTED
 
-        if not RoomStore._update_room_with_version(room, expected_version):
+        if not await RoomStore._update_room_with_version(room, expected_version):
             raise ConcurrentModificationError("Room was modified during sorting")
 
     @staticmethod
-    def add_message(room_id: str, message_blob: str) -> None:
+    async def add_message(room_id: str, message_blob: str) -> None:
         """Add an encrypted message with optimistic locking.
 
+        Concurrent messages for the same room are coalesced into one write.
+
         Raises:
             ValueError: If room not found, wrong state, or message limit reached.
             ConcurrentModificationError: If concurrent modification detected after retries.
         """
+        await _message_batches.submit(room_id, message_blob)
+
+    @staticmethod
+    async def _add_message_batch(
+        room_id: str, message_blobs: list[str]
+    ) -> list[Optional[ValueError]]:
+        """Append a batch of messages with one versioned write; see _AppendCoalescer."""
         for attempt in range(MAX_RETRIES):
-            room = RoomStore.get_room(room_id)
+            room = await RoomStore.get_room(room_id)
             if room is None:
                 raise ValueError(f"Room {room_id} not found")
             if room.status == RoomStatus.OPEN:
                 raise ValueError("Cannot send messages before sorting")
 
             # Limit messages to number of participants to prevent spam
-            if len(room.messages) >= len(room.sorted_keys):
-                raise ValueError("All participants have already submitted their addresses")
-
-            expected_version = room.version
+            capacity = max(len(room.sorted_keys) - len(room.messages), 0)
+            accepted = message_blobs[:capacity]
+            errors: list[Optional[ValueError]] = [None] * len(accepted) + [
+                ValueError("All participants have already submitted their addresses")
+                for _ in message_blobs[capacity:]
+            ]
+            if not accepted:
+                return errors
+
+            # Only the message list is rewritten; get_room reports MESSAGING
+            # once it is non-empty, so the room itself stays untouched.
+            if await RoomStore._update_messages(
+                room_id, len(room.messages), [*room.messages, *accepted]
+            ):
+                return errors
+
+            # Retry with jittered exponential backoff
+            await _backoff(attempt)
 
-            # Transition to MESSAGING on first message
-            if room.status == RoomStatus.SORTED:
-                room.status = RoomStatus.MESSAGING
-
-            room.messages.append(message_blob)
-
-            if RoomStore._update_room_with_version(room, expected_version):
-                return
+        raise ConcurrentModificationError("Failed to post message after max retries, please try again")
 
-            # Retry with exponential backoff
-            time.sleep(RETRY_DELAY_MS * (2 ** attempt) / 1000)
 
-        raise ConcurrentModificationError("Failed to post message after max retries, please try again")
+_participant_batches = _AppendCoalescer(RoomStore._add_participant_batch)
+_message_batches = _AppendCoalescer(RoomStore._add_message_batch)
@@ -0,0 +1,70 @@
+"""Shared fixtures: an in-memory stand-in for the Modal Dicts used by RoomStore."""
+
+import asyncio
+
+import pytest
+
+from backend.models.room import Room, RoomParams
+from backend.storage import room_store
+
+
+class _Method:
+    """Callable with an async .aio form, like Modal's Dict methods."""
+
+    def __init__(self, fn):
+        self._fn = fn
+
+    def __call__(self, *args, **kwargs):
+        return self._fn(*args, **kwargs)
+
+    async def aio(self, *args, **kwargs):
+        await asyncio.sleep(0)
+        return self._fn(*args, **kwargs)
+
+
+class FakeDict:
+    """In-memory modal.Dict supporting get/put(skip_if_exists)/pop."""
+
+    def __init__(self):
+        self.data = {}
+        self.puts = []
+        self.get = _Method(self._get)
+        self.put = _Method(self._put)
+        self.pop = _Method(self._pop)
+
+    def _get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def _put(self, key, value, skip_if_exists=False):
+        if skip_if_exists and key in self.data:
+            return False
+        self.data[key] = value
+        self.puts.append(key)
+        return True
+
+    def _pop(self, key):
+        return self.data.pop(key)
+
+
+@pytest.fixture
+def dicts(monkeypatch):
+    """Swap RoomStore's Modal Dicts for in-memory ones."""
+    rooms, claims = FakeDict(), FakeDict()
+    monkeypatch.setattr(room_store, "rooms_dict", rooms)
+    monkeypatch.setattr(room_store, "version_claims", claims)
+    monkeypatch.setattr(room_store, "RETRY_DELAY_MS", 0)
+    room_store._room_cache.clear()
+    return rooms, claims
+
+
+def make_room(room_id: str = "room") -> Room:
+    return Room(
+        id=room_id,
+        params=RoomParams(P="23", g="2"),
+        session_public_key="pk",
+        chair_secret_hash="00" * 32,
+    )
+
+
+def run(coro):
+    return asyncio.run(coro)
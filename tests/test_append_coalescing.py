@@ -0,0 +1,147 @@
+"""Coalesced registration and message appends."""
+
+import asyncio
+
+import pytest
+
+from backend.storage import room_store
+from backend.storage.room_store import ConcurrentModificationError, RoomStore
+
+from .conftest import make_room, run
+
+
+async def _gather(calls):
+    return await asyncio.gather(*calls, return_exceptions=True)
+
+
+def _error_messages(results):
+    return [str(r) if isinstance(r, Exception) else None for r in results]
+
+
+def test_concurrent_registrations_share_one_write(dicts):
+    rooms, claims = dicts
+
+    async def scenario():
+        await RoomStore.create_room(make_room())
+        keys = [f"k{i}" for i in range(10)] + ["k3", "k7"]
+        results = await _gather(RoomStore.add_participant("room", k) for k in keys)
+        return results, await RoomStore.get_room("room")
+
+    results, room = run(scenario())
+    assert _error_messages(results) == [None] * 10 + ["Duplicate registration"] * 2
+    assert room.participants == [f"k{i}" for i in range(10)]
+    assert room.version == 1
+    assert rooms.puts.count("room") == 2  # create + one batch
+
+
+def test_duplicate_of_stored_key_only_fails_that_caller(dicts):
+    async def scenario():
+        await RoomStore.create_room(make_room())
+        await RoomStore.add_participant("room", "a")
+        results = await _gather(RoomStore.add_participant("room", k) for k in ["a", "b"])
+        return results, await RoomStore.get_room("room")
+
+    results, room = run(scenario())
+    assert _error_messages(results) == ["Duplicate registration", None]
+    assert room.participants == ["a", "b"]
+
+
+def test_messages_beyond_participant_count_are_rejected(dicts):
+    async def scenario():
+        await RoomStore.create_room(make_room())
+        for key in ["a", "b", "c"]:
+            await RoomStore.add_participant("room", key)
+        await RoomStore.set_sorted_keys("room", ["1", "2", "3"])
+        await RoomStore.add_message("room", "m0")
+        results = await _gather(RoomStore.add_message("room", f"m{i}") for i in range(1, 5))
+        return results, await RoomStore.get_room("room")
+
+    results, room = run(scenario())
+    full = "All participants have already submitted their addresses"
+    assert _error_messages(results) == [None, None, full, full]
+    assert room.messages == ["m0", "m1", "m2"]
+
+
+def test_overlapping_message_batches_of_different_sizes(dicts):
+    rooms, claims = dicts
+
+    async def scenario():
+        await RoomStore.create_room(make_room())
+        for key in ["a", "b", "c"]:
+            await RoomStore.add_participant("room", key)
+        await RoomStore.set_sorted_keys("room", ["1", "2", "3"])
+        # Both batches read the room at 0 messages before either writes
+        results = await _gather([
+            RoomStore._add_message_batch("room", ["a1", "a2"]),
+            RoomStore._add_message_batch("room", ["b1"]),
+        ])
+        return results, await RoomStore.get_room("room")
+
+    results, room = run(scenario())
+    assert results == [[None, None], [None]]
+    assert sorted(room.messages) == ["a1", "a2", "b1"]
+    assert "room:messages:0" in claims.data
+
+
+def test_room_level_error_fails_whole_batch(dicts):
+    async def scenario():
+        return await _gather(RoomStore.add_participant("missing", k) for k in ["a", "b"])
+
+    results = run(scenario())
+    assert _error_messages(results) == ["Room missing not found"] * 2
+
+
+def test_exhausted_retries_fail_whole_batch(dicts):
+    rooms, claims = dicts
+
+    async def scenario():
+        await RoomStore.create_room(make_room())
+        # Another writer holds version 1 and is still within its lease
+        claims.data["room:1"] = {"at": 1e12, "gen": 0}
+        return await _gather(RoomStore.add_participant("room", k) for k in ["a", "b"])
+
+    results = run(scenario())
+    assert all(isinstance(r, ConcurrentModificationError) for r in results)
+
+
+def test_cancelled_write_does_not_hang_callers(dicts, monkeypatch):
+    rooms, claims = dicts
+
+    async def scenario():
+        await RoomStore.create_room(make_room())
+        real_put = rooms.put
+
+        class CancellingPut:
+            async def aio(self, key, value, skip_if_exists=False):
+                raise asyncio.CancelledError
+
+        monkeypatch.setattr(rooms, "put", CancellingPut())
+        results = await asyncio.wait_for(
+            _gather(RoomStore.add_participant("room", k) for k in ["a", "b"]), timeout=1
+        )
+        monkeypatch.setattr(rooms, "put", real_put)
+
+        await RoomStore.add_participant("room", "c")
+        return results, await RoomStore.get_room("room")
+
+    results, room = run(scenario())
+    assert all(isinstance(r, ConcurrentModificationError) for r in results)
+    assert room.participants == ["c"]
+
+
+@pytest.mark.parametrize("cancel_after", [0, 0.005], ids=["before-start", "mid-window"])
+def test_cancelled_drain_does_not_wedge_room(dicts, cancel_after):
+    async def scenario():
+        await RoomStore.create_room(make_room())
+        caller = asyncio.ensure_future(RoomStore.add_participant("room", "a"))
+        await asyncio.sleep(cancel_after)
+        for task in list(room_store._participant_batches._drains):
+            task.cancel()
+        with pytest.raises(ConcurrentModificationError):
+            await asyncio.wait_for(caller, timeout=1)
+
+        await asyncio.wait_for(RoomStore.add_participant("room", "b"), timeout=1)
+        return await RoomStore.get_room("room")
+
+    room = run(scenario())
+    assert room.participants == ["b"]
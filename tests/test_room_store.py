@@ -0,0 +1,160 @@
+"""RoomStore tests against in-memory Dicts."""
+
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from backend.models.room import RoomStatus
+from backend.storage import room_store
+from backend.storage.room_store import ConcurrentModificationError, RoomStore
+
+from .conftest import make_room, run
+
+
+def test_cancelled_write_releases_claim(dicts, monkeypatch):
+    rooms, claims = dicts
+
+    async def scenario():
+        await RoomStore.create_room(make_room())
+
+        real_put = rooms.put
+
+        class CancellingPut:
+            async def aio(self, key, value, skip_if_exists=False):
+                raise asyncio.CancelledError
+
+        room = await RoomStore.get_room("room")
+        room.participants = ["a"]
+        monkeypatch.setattr(rooms, "put", CancellingPut())
+        with pytest.raises(asyncio.CancelledError):
+            await RoomStore._update_room_with_version(room, 0)
+        monkeypatch.setattr(rooms, "put", real_put)
+
+        await RoomStore.add_participant("room", "b")
+        return await RoomStore.get_room("room")
+
+    room = run(scenario())
+    assert room.participants == ["b"]
+    assert room.version == 1
+
+
+def test_stale_claim_is_taken_over(dicts):
+    rooms, claims = dicts
+
+    async def scenario():
+        await RoomStore.create_room(make_room())
+        # A writer claimed version 1 long ago and died before writing
+        claims.data["room:1"] = {"at": time.time() - room_store.CLAIM_STALE_SECONDS - 1, "gen": 0}
+        await RoomStore.add_participant("room", "a")
+        return await RoomStore.get_room("room")
+
+    room = run(scenario())
+    assert room.participants == ["a"]
+    assert claims.data["room:1"]["gen"] == 1
+    assert "room:1~1" in claims.data
+
+
+def test_fresh_claim_is_not_taken_over(dicts):
+    rooms, claims = dicts
+
+    async def scenario():
+        await RoomStore.create_room(make_room())
+        claims.data["room:1"] = {"at": time.time(), "gen": 0}
+        await RoomStore.add_participant("room", "a")
+
+    with pytest.raises(ConcurrentModificationError):
+        run(scenario())
+
+
+def test_stale_claim_behind_stored_version_is_kept(dicts):
+    rooms, claims = dicts
+
+    async def scenario():
+        await RoomStore.create_room(make_room())
+        await RoomStore.add_participant("room", "a")
+        claims.data["room:1"]["at"] = 0
+        room = await RoomStore.get_room("room")
+        # A lagging writer still at version 0 must not reuse the old claim
+        return await RoomStore._update_room_with_version(room, 0)
+
+    assert run(scenario()) is False
+
+
+def test_delete_room_removes_claims(dicts):
+    rooms, claims = dicts
+
+    async def scenario():
+        await RoomStore.create_room(make_room())
+        for key in ["a", "b", "c"]:
+            await RoomStore.add_participant("room", key)
+        await RoomStore.set_sorted_keys("room", ["1", "2", "3"])
+        claims.data["room:5"] = {"at": 0, "gen": 1}
+        claims.data["room:5~1"] = 0.0
+        await RoomStore.add_message("room", "m1")
+        return await RoomStore.delete_room("room")
+
+    assert run(scenario()) is True
+    assert rooms.data == {}
+    assert claims.data == {}
+
+
+def _legacy_payload(created_at: datetime) -> str:
+    """A room as stored before created_at_ns: model_dump_json with messages inline."""
+    return json.dumps({
+        "id": "room",
+        "status": "MESSAGING",
+        "params": {"P": "23", "g": "2"},
+        "session_public_key": "pk",
+        "chair_secret_hash": "00" * 32,
+        "participants": ["a", "b", "c"],
+        "sorted_keys": ["1", "2", "3"],
+        "messages": ["m1"],
+        "created_at": created_at.isoformat(),
+        "version": 2,
+    }, separators=(",", ":"))
+
+
+def test_legacy_room_is_migrated_on_read(dicts):
+    rooms, claims = dicts
+    created_at = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=1)
+    rooms.data["room"] = _legacy_payload(created_at)
+
+    room = run(RoomStore.get_room("room"))
+    assert room.created_at_ns == int(
+        created_at.replace(tzinfo=timezone.utc).timestamp() * 1_000_000_000
+    )
+    assert room.participants == ["a", "b", "c"]
+    assert room.messages == ["m1"]
+    assert room.status == RoomStatus.MESSAGING
+    assert room.version == 2
+
+
+def test_expired_legacy_room_is_deleted(dicts):
+    rooms, claims = dicts
+    created_at = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(
+        seconds=room_store.ROOM_TTL_SECONDS + 60
+    )
+    rooms.data["room"] = _legacy_payload(created_at)
+
+    assert run(RoomStore.get_room("room")) is None
+    assert rooms.data == {}
+
+
+@pytest.mark.parametrize("encode", [str, str.encode], ids=["str", "bytes"])
+def test_uncompressed_payloads_are_read(dicts, encode):
+    rooms, claims = dicts
+    room = make_room()
+    room.participants = ["a", "b", "c"]
+    room.sorted_keys = ["1", "2", "3"]
+    room.status = RoomStatus.SORTED
+    # Written before compression: plain JSON, as str or orjson bytes
+    rooms.data["room"] = encode(room.model_dump_json())
+    rooms.data["room:messages"] = encode(json.dumps(["m1", "m2"]))
+
+    stored = run(RoomStore.get_room("room"))
+    assert stored.participants == ["a", "b", "c"]
+    assert stored.messages == ["m1", "m2"]
+    assert stored.status == RoomStatus.MESSAGING
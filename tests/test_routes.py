@@ -0,0 +1,82 @@
+"""Route-level tests for conditional reads."""
+
+import hashlib
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.api.routes import router
+
+CHAIR_SECRET = "chair-secret"
+
+
+@pytest.fixture
+def client(dicts):
+    app = FastAPI()
+    app.include_router(router)
+    with TestClient(app) as client:
+        yield client
+
+
+def _create_room(client: TestClient) -> str:
+    response = client.post("/room", json={
+        "P": "23",
+        "g": "2",
+        "sessionPublicKey": "pk",
+        "chairSecretHash": hashlib.sha256(CHAIR_SECRET.encode()).hexdigest(),
+    })
+    return response.json()["roomId"]
+
+
+def _etag(client: TestClient, path: str) -> str:
+    response = client.get(path)
+    assert response.status_code == 200
+    return response.headers["ETag"]
+
+
+@pytest.mark.parametrize("suffix", ["", "/participants", "/messages"])
+def test_matching_etag_returns_not_modified(client, suffix):
+    path = f"/room/{_create_room(client)}{suffix}"
+    etag = _etag(client, path)
+
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+
+    response = client.get(path, headers={"If-None-Match": 'W/"other", ' + etag})
+    assert response.status_code == 304
+
+    response = client.get(path, headers={"If-None-Match": 'W/"other"'})
+    assert response.status_code == 200
+
+
+def test_etag_changes_on_every_readable_change(client):
+    room_id = _create_room(client)
+    path = f"/room/{room_id}"
+    etags = [_etag(client, path)]
+
+    for key in ["a", "b", "c"]:
+        client.post(f"{path}/register", json={"encryptedKey": key})
+        etags.append(_etag(client, path))
+
+    response = client.post(
+        f"{path}/sort",
+        json={"sortedKeys": ["1", "2", "3"]},
+        headers={"X-Chair-Secret": CHAIR_SECRET},
+    )
+    assert response.status_code == 200
+    etags.append(_etag(client, path))
+    assert client.get(path).json()["status"] == "SORTED"
+
+    # The first message only rewrites the message list, not the room itself;
+    # SORTED -> MESSAGING is derived from the message count
+    client.post(f"{path}/message", json={"blob": "m1"})
+    etags.append(_etag(client, path))
+    assert client.get(path).json()["status"] == "MESSAGING"
+
+    assert len(set(etags)) == len(etags)
+    response = client.get(path, headers={"If-None-Match": etags[-2]})
+    assert response.status_code == 200
+    assert response.json()["messages"] == ["m1"]